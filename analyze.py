@@ -1,7 +1,14 @@
 import sys
 import os
+import hashlib
+import tempfile
+import zipfile
 import numpy as np
 import librosa
+from numba import njit, prange, types
+from numpy.lib.stride_tricks import sliding_window_view
+import matplotlib
+matplotlib.use('Agg')  # Plots are only saved to file, so skip the GUI backend
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 import pandas as pd
@@ -11,77 +18,211 @@ from typing import Dict, List, Tuple
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def vectorized_higuchi_fd(time_series: np.ndarray, k_max: int) -> float:
-    """Calculate the Higuchi Fractal Dimension of the time series using vectorization."""
-    N = len(time_series)
-    k_range = np.arange(1, min(k_max, N//2) + 1)
-    Lk = np.zeros(len(k_range))
-    
-    for k_idx, k in enumerate(k_range):
-        Lmk = np.zeros(k)
-        for m in range(k):
-            indices = np.arange(1, (N-m)//k)
-            Lmki = np.sum(np.abs(time_series[m+indices*k] - time_series[m+(indices-1)*k]))
-            Lmki = Lmki * (N - 1) / (((N-m)//k) * k)
-            Lmk[m] = Lmki
-        Lk[k_idx] = np.mean(Lmk)
+# Decoded audio is cached here so repeated runs skip decoding and resampling
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# Read-only, C-contiguous float32 vector; writeable arrays are accepted as well
+_f4_vector = types.Array(types.float32, 1, 'C', readonly=True)
+
+@njit(cache=True)
+def _slope(x: np.ndarray, y: np.ndarray):
+    """Least-squares slope of y against x; a 2D y of shape (len(x), n) is fitted column by column."""
+    x_centered = x - x.mean()
+    # sum((x - x̄) * ȳ) vanishes, so y does not need centering
+    return (x_centered @ y) / (x_centered @ x_centered)
+
+@njit(cache=True)
+def _higuchi_tables(N: int, k_max: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Precompute log(1/k) and the curve length normalisations of the long and short curves for series of length N."""
+    n_k = min(k_max, N // 2)
+    log_inv_k = np.empty(n_k)
+    norm_long = np.empty(n_k)
+    norm_short = np.empty(n_k)
     
-    x = np.log(1/k_range)
-    y = np.log(Lk)
-    polyfit = np.polyfit(x, y, 1)
-    return polyfit[0]
+    for k in range(1, n_k + 1):
+        log_inv_k[k-1] = np.log(1.0 / k)
+        # Curve m has (N - m) // k points: N // k for m <= N % k and one fewer for the rest.
+        # Also folds in the 1/k of the mean over the k curves Lm(k)
+        norm_long[k-1] = (N - 1) / ((N // k) * k * k)
+        norm_short[k-1] = (N - 1) / ((N // k - 1) * k * k)
+    return log_inv_k, norm_long, norm_short
 
-def vectorized_dfa(time_series: np.ndarray, scale_lim: List[int] = [5, 100]) -> float:
-    """Perform vectorized Detrended Fluctuation Analysis (DFA) on the time series."""
-    N = len(time_series)
-    scales = np.arange(scale_lim[0], min(scale_lim[1], N // 4))
-    F = np.zeros(len(scales))
+@njit(types.float64(_f4_vector, types.float64[::1], types.float64[::1], types.float64[::1]), cache=True, fastmath=True)
+def _higuchi_kernel(ts: np.ndarray, log_inv_k: np.ndarray, norm_long: np.ndarray, norm_short: np.ndarray) -> float:
+    """Compiled core of the Higuchi Fractal Dimension, including the log-log slope fit."""
+    N = ts.shape[0]
+    n_k = log_inv_k.shape[0]
+    log_Lk = np.empty(n_k)
     
-    y = np.cumsum(time_series - np.mean(time_series))
+    for k in range(1, n_k + 1):
+        # Curve m uses the increments |ts[j+k] - ts[j]| with j = m (mod k), and together the curves use
+        # each j in [0, N - 2k] exactly once, so one contiguous, vectorisable pass sums them all
+        last = N - 2*k
+        total = 0.0
+        for j in range(last + 1):
+            total += abs(ts[j + k] - ts[j])
+        
+        # The long curves m <= N % k and the short ones m > N % k are normalised differently;
+        # walk whichever group has fewer curves with a stride of k and get the other by subtraction
+        r = N % k
+        first, stop = (0, r + 1) if r + 1 <= k - r - 1 else (r + 1, k)
+        group = 0.0
+        for m in range(first, stop):
+            prev = ts[m]
+            for j in range(m + k, last + k + 1, k):
+                cur = ts[j]
+                group += abs(cur - prev)
+                prev = cur
+        longer = group if first == 0 else total - group
+        
+        Lk = longer * norm_long[k-1]
+        if r + 1 < k:
+            Lk += (total - longer) * norm_short[k-1]
+        log_Lk[k-1] = np.log(Lk)
     
-    for i, scale in enumerate(scales):
+    return _slope(log_inv_k, log_Lk)
+
+def vectorized_higuchi_fd(time_series: np.ndarray, k_max: int) -> float:
+    """Calculate the Higuchi Fractal Dimension of the time series using a compiled kernel."""
+    tables = _higuchi_tables(len(time_series), k_max)
+    return _higuchi_kernel(np.ascontiguousarray(time_series, dtype=np.float32), *tables)
+
+@njit(cache=True, fastmath=True)
+def _dfa_kernel(y: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Compiled DFA fluctuation function, detrending every segment with a closed-form linear fit."""
+    N = y.shape[0]
+    F = np.empty(scales.shape[0])
+    
+    for i in range(scales.shape[0]):
+        scale = scales[i]
         segments = N // scale
-        F_scale = np.zeros(segments)
+        # Sums over t = 0..scale-1 are the same for every segment of this scale
+        sum_t = scale * (scale - 1) / 2
+        sum_tt = (scale - 1) * scale * (2*scale - 1) / 6
+        ss_t = sum_tt - sum_t**2 / scale
         
+        F_scale = 0.0
         for j in range(segments):
             segment = y[j*scale:(j+1)*scale]
-            t = np.arange(scale)
-            coef = np.polyfit(t, segment, 1)
-            trend = np.polyval(coef, t)
-            F_scale[j] = np.sqrt(np.mean((segment - trend)**2))
-        
-        F[i] = np.mean(F_scale)
+            # Shifting by the first sample leaves the residuals unchanged and limits cancellation
+            y0 = segment[0]
+            sum_y = 0.0
+            sum_ty = 0.0
+            sum_yy = 0.0
+            t = 0.0  # float counter avoids an int-to-float conversion per sample
+            for k in range(scale):
+                v = np.float64(segment[k] - y0)
+                sum_y += v
+                sum_ty += t * v
+                sum_yy += v * v
+                t += 1.0
+            # Residual sum of squares of the least-squares line, obtained without a second pass
+            sp_ty = sum_ty - sum_t * sum_y / scale
+            residual = sum_yy - sum_y**2 / scale - sp_ty**2 / ss_t
+            F_scale += np.sqrt(max(residual, 0.0) / scale)
+        F[i] = F_scale / segments
+    return F
+
+@njit(cache=True)
+def _profile(ts: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Write the cumulative sum of the mean-removed series into out, without an intermediate array."""
+    total = 0.0
+    for i in range(ts.shape[0]):
+        total += ts[i]
+    mean = total / ts.shape[0]
+    
+    acc = 0.0
+    for i in range(ts.shape[0]):
+        acc += ts[i] - mean
+        out[i] = acc
+    return out
+
+def vectorized_dfa(time_series: np.ndarray, scale_lim: List[int] = [5, 100]) -> float:
+    """Perform Detrended Fluctuation Analysis (DFA) on the time series using a compiled kernel."""
+    N = len(time_series)
+    scales = np.arange(scale_lim[0], min(scale_lim[1], N // 4), dtype=np.int64)
     
-    log_scales = np.log(scales)
-    log_F = np.log(F)
+    # Accumulate in float64 but keep the profile that the kernel streams through in float32
+    y = _profile(np.asarray(time_series), np.empty(N, dtype=np.float32))
+    F = _dfa_kernel(y, scales)
     
-    coef = np.polyfit(log_scales, log_F, 1)
-    return coef[0]
+    return _slope(np.log(scales), np.log(F))
 
-def analyze_audio(audio_file: str, duration: int = 60, k_max: int = 10, window_sizes: List[float] = [1, 3]) -> Tuple[Dict, int]:
+@njit(cache=True, parallel=True)
+def _analyze_all(windows: np.ndarray, profiles: np.ndarray, k_max: int, scale_lim: Tuple[int, int],
+                 hfd: np.ndarray, dfa: np.ndarray):
+    """Fill hfd and dfa with the HFD of every window and the DFA of the matching profile window, in parallel."""
+    n_windows, N = windows.shape
+    log_inv_k, norm_long, norm_short = _higuchi_tables(N, k_max)
+    scales = np.arange(scale_lim[0], min(scale_lim[1], N // 4))
+    log_scales = np.log(scales.astype(np.float64))
+    
+    # Windows are independent; the kernels stay serial so there is no nested parallelism
+    for w in prange(n_windows):
+        # Rows of a 2D view are typed as non-contiguous; contiguous copies keep the kernel loops vectorised
+        hfd[w] = _higuchi_kernel(np.ascontiguousarray(windows[w]), log_inv_k, norm_long, norm_short)
+        dfa[w] = _slope(log_scales, np.log(_dfa_kernel(np.ascontiguousarray(profiles[w]), scales)))
+
+def load_audio(audio_file: str, duration: int) -> Tuple[np.ndarray, int]:
+    """Load an audio file with librosa, reusing a cached decode keyed by path, mtime and duration."""
+    key = f"{os.path.abspath(audio_file)}|{os.path.getmtime(audio_file)}|{duration}"
+    cache_file = os.path.join(CACHE_DIR, hashlib.md5(key.encode()).hexdigest() + '.npz')
+    
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cached:
+                signal, sr = cached['signal'], int(cached['sr'])
+            logging.info(f"Using cached decode of {audio_file}")
+            return signal, sr
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logging.warning(f"Ignoring unreadable cache entry {cache_file}: {str(e)}")
+    
+    signal, sr = librosa.load(audio_file, sr=None, duration=duration)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write under a temporary name and rename, so an interrupted or concurrent run never leaves a truncated entry
+        fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=CACHE_DIR)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, signal=signal, sr=sr)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+    except OSError as e:
+        logging.warning(f"Could not cache decoded audio: {str(e)}")
+    return signal, sr
+
+def analyze_audio(audio_file: str, duration: int = 60, k_max: int = 10, window_sizes: List[float] = [1, 3],
+                  scale_lim: List[int] = [5, 100]) -> Tuple[Dict, int]:
     """Perform multi-scale fractal analysis on an audio file."""
     logging.info(f"Analyzing audio file: {audio_file}")
     try:
-        signal, sr = librosa.load(audio_file, sr=None, duration=duration)
+        signal, sr = load_audio(audio_file, duration)
+        
+        step_samples = int(0.1 * sr)  # 10% overlap
+        signal = signal.astype(np.float32, copy=False)
+        
+        # The number of windows per size is known up front, so the results are allocated once.
+        # 'n' is the length shared by every series, and by the classifications derived from them.
+        n_windows = {size: (len(signal) - int(size * sr)) // step_samples + 1 for size in window_sizes}
+        results = {
+            'time': np.arange(n_windows[window_sizes[0]]) * step_samples / sr,
+            'hfd': {size: np.empty(n_windows[size], dtype=np.float32) for size in window_sizes},
+            'dfa': {size: np.empty(n_windows[size], dtype=np.float32) for size in window_sizes},
+            'n': min(n_windows.values())
+        }
         
-        results = {'time': [], 'hfd': {size: [] for size in window_sizes}, 'dfa': {size: [] for size in window_sizes}}
+        # A window's own profile differs from the matching slice of this one only by a constant and a
+        # linear ramp, which DFA detrends away. Kept in float64 as it grows with the signal length.
+        profile = _profile(signal, np.empty(len(signal)))
         
-        for size in window_sizes:
+        for size in tqdm(window_sizes, desc="Analyzing window sizes"):
             window_samples = int(size * sr)
-            step_samples = int(0.1 * sr)  # 10% overlap
+            windows = sliding_window_view(signal, window_samples)[::step_samples]
+            profiles = sliding_window_view(profile, window_samples)[::step_samples]
             
-            for i in tqdm(range(0, len(signal) - window_samples + 1, step_samples),
-                          desc=f"Analyzing (window: {size}s)"):
-                end = i + window_samples
-                window = signal[i:end]
-                
-                hfd = vectorized_higuchi_fd(window, k_max)
-                dfa_result = vectorized_dfa(window)
-                
-                if size == window_sizes[0]:
-                    results['time'].append(i / sr)
-                results['hfd'][size].append(hfd)
-                results['dfa'][size].append(dfa_result)
+            _analyze_all(windows, profiles, k_max, tuple(scale_lim), results['hfd'][size], results['dfa'][size])
         
         logging.info("Audio analysis completed successfully")
         return results, sr
@@ -100,70 +241,65 @@ def adaptive_threshold(results: Dict) -> Tuple[float, float]:
     logging.info(f"Calculated thresholds - HFD: {hfd_threshold:.4f}, DFA: {dfa_threshold:.4f}")
     return hfd_threshold, dfa_threshold
 
-def classify_voice(results: Dict, hfd_threshold: float, dfa_threshold: float) -> List[bool]:
+def classify_voice(results: Dict, hfd_threshold: float, dfa_threshold: float) -> np.ndarray:
     """Classify voice segments based on HFD and DFA thresholds."""
-    classifications = []
-    min_length = min(len(results['hfd'][size]) for size in results['hfd'])
+    min_length = results['n']
     
     window_size = 5  # Consider 5 segments at a time
     hfd_weight = 0.7  # Give more weight to HFD
     dfa_weight = 0.3
     
-    for i in range(min_length - window_size + 1):
-        window_hfd = [results['hfd'][size][i:i+window_size] for size in results['hfd']]
-        window_dfa = [results['dfa'][size][i:i+window_size] for size in results['dfa']]
-        
-        hfd_avg = np.mean([np.mean(w) for w in window_hfd])
-        dfa_avg = np.mean([np.mean(w) for w in window_dfa])
-        
-        hfd_var = np.mean([np.std(w) for w in window_hfd])
-        dfa_var = np.mean([np.std(w) for w in window_dfa])
-        
-        # Higher values and higher variability suggest AI-generated voice
-        hfd_ai = (hfd_avg > hfd_threshold) or (hfd_var > 0.1)
-        dfa_ai = (dfa_avg > dfa_threshold) or (dfa_var > 0.05)
-        
-        is_ai = (hfd_weight * hfd_ai + dfa_weight * dfa_ai) > 0.5
-        classifications.append(is_ai)
+    # Rolling windows of shape (n_sizes, min_length - window_size + 1, window_size)
+    hfd_windows = sliding_window_view(np.stack([results['hfd'][size][:min_length] for size in results['hfd']]), window_size, axis=1)
+    dfa_windows = sliding_window_view(np.stack([results['dfa'][size][:min_length] for size in results['dfa']]), window_size, axis=1)
+    
+    hfd_avg = hfd_windows.mean(axis=(0, -1))
+    dfa_avg = dfa_windows.mean(axis=(0, -1))
     
-    # Pad the classifications list to match the original length
-    classifications.extend([classifications[-1]] * (window_size - 1))
+    hfd_var = hfd_windows.std(axis=-1).mean(axis=0)
+    dfa_var = dfa_windows.std(axis=-1).mean(axis=0)
     
-    logging.info(f"Voice classification completed. {sum(classifications)} segments classified as AI-generated.")
+    # Higher values and higher variability suggest AI-generated voice
+    hfd_ai = (hfd_avg > hfd_threshold) | (hfd_var > 0.1)
+    dfa_ai = (dfa_avg > dfa_threshold) | (dfa_var > 0.05)
+    
+    classifications = (hfd_weight * hfd_ai.astype(np.float32) + dfa_weight * dfa_ai.astype(np.float32)) > 0.5
+    
+    # Pad the classifications with the last value to match the original length
+    classifications = np.pad(classifications, (0, window_size - 1), mode='edge')
+    
+    logging.info(f"Voice classification completed. {np.count_nonzero(classifications)} segments classified as AI-generated.")
     return classifications
 
-def save_results_to_csv(results: Dict, classifications: List[bool], filename: str):
+def save_results_to_csv(results: Dict, classifications: np.ndarray, filename: str):
     """Save analysis results to a CSV file."""
     logging.info(f"Saving results to {filename}")
     try:
-        min_length = min(len(results['time']), len(classifications),
-                         *(len(results['hfd'][size]) for size in results['hfd']),
-                         *(len(results['dfa'][size]) for size in results['dfa']))
+        min_length = results['n']
         
-        df = pd.DataFrame({
-            'Time': results['time'][:min_length],
-            'Classification': classifications[:min_length]
-        })
+        # Build the frame in one go with compact dtypes instead of inserting columns one at a time
+        columns = {
+            'Time': np.asarray(results['time'][:min_length], dtype=np.float32),
+            'Classification': np.asarray(classifications[:min_length], dtype=bool)
+        }
         
         for size in results['hfd']:
-            df[f'HFD_{size}s'] = results['hfd'][size][:min_length]
-            df[f'DFA_{size}s'] = results['dfa'][size][:min_length]
+            columns[f'HFD_{size}s'] = np.asarray(results['hfd'][size][:min_length], dtype=np.float32)
+            columns[f'DFA_{size}s'] = np.asarray(results['dfa'][size][:min_length], dtype=np.float32)
         
-        df.to_csv(filename, index=False)
+        pd.DataFrame(columns).to_csv(filename, index=False, float_format='%.5f')
         logging.info(f"Results successfully saved to {filename}")
     except Exception as e:
         logging.error(f"Error saving results to CSV: {str(e)}")
         raise
 
-def plot_results(results: Dict, hfd_threshold: float, dfa_threshold: float, classifications: List[bool], filename: str):
+def plot_results(results: Dict, hfd_threshold: float, dfa_threshold: float, classifications: np.ndarray, filename: str):
     """Create and save a visualization of the fractal analysis results."""
     logging.info("Plotting results")
     try:
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), sharex=True)
         
-        min_length = min(len(results['time']), len(classifications),
-                         *(len(results['hfd'][size]) for size in results['hfd']),
-                         *(len(results['dfa'][size]) for size in results['dfa']))
+        min_length = results['n']
         
         for size in results['hfd']:
             ax1.plot(results['time'][:min_length], results['hfd'][size][:min_length], label=f'HFD {size}s')
@@ -180,44 +316,41 @@ def plot_results(results: Dict, hfd_threshold: float, dfa_threshold: float, clas
         ax2.legend()
         ax2.grid(True)
         
+        # A single step-filled area shades every AI-classified [time[i], time[i+1]) segment; the x-axis
+        # transform spans the full axes height in axes coordinates, like axvspan
+        is_ai = np.asarray(classifications[:min_length], dtype=np.float32)
         for ax in (ax1, ax2):
-            for i, cls in enumerate(classifications[:min_length]):
-                if cls:
-                    ax.axvspan(results['time'][i], results['time'][i+1] if i+1 < min_length else results['time'][min_length-1],
-                               alpha=0.2, color='green')
+            ax.fill_between(results['time'][:min_length], 0, is_ai, step='post', transform=ax.get_xaxis_transform(),
+                            alpha=0.2, color='green', linewidth=0)
         
         plt.tight_layout()
         plt.savefig(filename)
+        plt.close(fig)
         logging.info(f"Plot saved as '{filename}'")
     except Exception as e:
         logging.error(f"Error plotting results: {str(e)}")
         raise
 
-def retroactive_analysis(results: Dict, classifications: List[bool]) -> List[Dict]:
+def retroactive_analysis(results: Dict, classifications: np.ndarray) -> List[Dict]:
     """Perform retroactive analysis on three segments of the audio."""
     logging.info("Performing retroactive analysis")
-    min_length = min(len(results['time']), len(classifications),
-                     *(len(results['hfd'][size]) for size in results['hfd']),
-                     *(len(results['dfa'][size]) for size in results['dfa']))
+    min_length = results['n']
     
     total_duration = results['time'][min_length - 1]
     segment_duration = total_duration / 3
     
-    segments = [
-        (0, segment_duration),
-        (segment_duration, 2 * segment_duration),
-        (2 * segment_duration, total_duration)
-    ]
+    # Times are sorted, so each [start, end) segment is a contiguous index range
+    times = np.asarray(results['time'][:min_length])
+    bounds = np.searchsorted(times, [0, segment_duration, 2 * segment_duration, total_duration])
+    classifications = np.asarray(classifications[:min_length])
     
     segment_analysis = []
     
-    for start, end in segments:
-        segment_indices = (np.array(results['time'][:min_length]) >= start) & (np.array(results['time'][:min_length]) < end)
-        
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
         segment_data = {
-            'hfd': {size: np.mean(np.array(results['hfd'][size][:min_length])[segment_indices]) for size in results['hfd']},
-            'dfa': {size: np.mean(np.array(results['dfa'][size][:min_length])[segment_indices]) for size in results['dfa']},
-            'classification': np.mean(np.array(classifications[:min_length])[segment_indices])
+            'hfd': {size: np.mean(results['hfd'][size][lo:hi]) for size in results['hfd']},
+            'dfa': {size: np.mean(results['dfa'][size][lo:hi]) for size in results['dfa']},
+            'classification': np.mean(classifications[lo:hi])
         }
         
         segment_analysis.append(segment_data)
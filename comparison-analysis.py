@@ -5,8 +5,10 @@ import seaborn as sns
 import numpy as np
 import os
 
+MEASURE_COLUMNS = [f'{measure}_{window_size}' for measure in ['HFD', 'DFA'] for window_size in ['1s', '3s']]
+
 def load_csv(file_path):
-    return pd.read_csv(file_path)
+    return pd.read_csv(file_path, dtype={'Classification': bool, **{column: np.float32 for column in MEASURE_COLUMNS}})
 
 def plot_comparison(df1, df2, measure, window_size, output_file, label1, label2):
     plt.figure(figsize=(12, 6))
@@ -34,15 +36,10 @@ def plot_classification_comparison(df1, df2, output_file, label1, label2):
     plt.close()
     print(f"Classification comparison plot saved as '{output_file}'")
 
-def calculate_statistics(df, measure, window_size):
-    data = df[f'{measure}_{window_size}']
-    return {
-        'mean': np.mean(data),
-        'median': np.median(data),
-        'std': np.std(data),
-        'min': np.min(data),
-        'max': np.max(data)
-    }
+def calculate_statistics(df):
+    stats = df[MEASURE_COLUMNS].agg(['mean', 'median', 'min', 'max'])
+    stats.loc['std'] = df[MEASURE_COLUMNS].std(ddof=0)  # population std, as np.std
+    return stats.T[['mean', 'median', 'std', 'min', 'max']]
 
 def compare_files(file1, file2):
     df1 = load_csv(file1)
@@ -58,24 +55,25 @@ def compare_files(file1, file2):
 
     comparison_data = []
 
+    stats1 = calculate_statistics(df1)
+    stats2 = calculate_statistics(df2)
+
     for measure in ['HFD', 'DFA']:
         for window_size in ['1s', '3s']:
             plot_comparison(df1, df2, measure, window_size, f'{measure}_{window_size}_comparison.png', label1, label2)
             
-            stats1 = calculate_statistics(df1, measure, window_size)
-            stats2 = calculate_statistics(df2, measure, window_size)
-            
+            column = f'{measure}_{window_size}'
             comparison_data.append({
                 'Measure': measure,
                 'Window': window_size,
                 'File': label1,
-                **stats1
+                **stats1.loc[column].to_dict()
             })
             comparison_data.append({
                 'Measure': measure,
                 'Window': window_size,
                 'File': label2,
-                **stats2
+                **stats2.loc[column].to_dict()
             })
 
     plot_classification_comparison(df1, df2, 'classification_comparison.png', label1, label2)
@@ -1,7 +1,37 @@
 import sys
-from analyze import main as analyze_main
+import numpy as np
+from analyze import main as analyze_main, vectorized_higuchi_fd
+
+def reference_higuchi_fd(time_series: np.ndarray, k_max: int) -> float:
+    """Higuchi Fractal Dimension with the plain per-(k, m) curve loop, as a reference for the compiled kernel."""
+    N = len(time_series)
+    k_range = np.arange(1, min(k_max, N//2) + 1)
+    Lk = np.zeros(len(k_range))
+    
+    for k_idx, k in enumerate(k_range):
+        Lmk = np.zeros(k)
+        for m in range(k):
+            indices = np.arange(1, (N-m)//k)
+            Lmki = np.sum(np.abs(time_series[m+indices*k] - time_series[m+(indices-1)*k]))
+            Lmk[m] = Lmki * (N - 1) / (((N-m)//k) * k)
+        Lk[k_idx] = np.mean(Lmk)
+    
+    return np.polyfit(np.log(1/k_range), np.log(Lk), 1)[0]
+
+def check_higuchi_kernel():
+    """Compare the compiled HFD kernel with the reference loop, including lengths that are not a multiple of k."""
+    rng = np.random.default_rng(0)
+    for N in [7, 101, 1001, 4799]:
+        ts = rng.standard_normal(N).astype(np.float32)
+        for k_max in [2, 5, 10, 17]:
+            expected = reference_higuchi_fd(ts.astype(np.float64), k_max)
+            actual = vectorized_higuchi_fd(ts, k_max)
+            assert abs(actual - expected) < 1e-5, f"HFD mismatch for N={N}, k_max={k_max}: {actual} != {expected}"
+    print("HFD kernel matches the reference loop.")
 
 if __name__ == "__main__":
+    check_higuchi_kernel()
+    
     test_audio_file = "test-samples/voicekey-test1-human.wav"
     
     # Call the main function from analyze.py